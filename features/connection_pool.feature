@@ -0,0 +1,38 @@
+# Feature file for the database connection pool
+
+Feature: Pool database connections
+
+  As a developer exporting schema and lineage in one process
+  I want database connections to be pooled and checked before reuse
+  So that repeated work skips the login handshake and never gets a dead connection.
+
+  # pyodbc.connect is replaced with an in-memory fake, so no database is needed.
+  Background: Fake database driver
+    Given pyodbc.connect is replaced with a fake connection factory
+
+  Scenario: Reuse a released connection
+    Given a connection pool with a max_size of 2
+    When a connection is acquired and released 2 times
+    Then 1 connection should have been opened
+
+  Scenario: Replace a connection that fails validation
+    Given a connection pool with a max_size of 2
+    And a connection was acquired and released
+    When the pooled connection stops responding
+    And a connection is acquired and released 1 times
+    Then the broken connection should have been closed
+    And 2 connections should have been opened
+
+  Scenario: Time out when every connection is in use
+    Given a connection pool with a max_size of 1
+    When a connection is held while another is acquired with a timeout of 0.1 seconds
+    Then the pool should report that no connection became available
+
+  Scenario: Close connections that are released after the pool is closed
+    Given a connection pool with a max_size of 2
+    When a connection is acquired, the pool is closed, and the connection is released
+    Then every opened connection should be closed
+
+  Scenario: Reject a minimum size above the maximum size
+    When a connection pool with a min_size of 3 and a max_size of 2 is created
+    Then the pool should be rejected as invalid
@@ -14,7 +14,7 @@ Feature: Generate Data Lineage Map
     When the lineage generation process is run for the database
     Then the tool should query database dependencies successfully
     And a lineage graph DOT file named "<database_name>_lineage.gv" should be created in the output directory
-    And a rendered lineage graph image named "<database_name>_lineage.gv.png" should be created in the output directory
+    And a rendered lineage graph image named "<database_name>_lineage.gv.svg" should be created in the output directory
 
   Scenario: Handle connection failure during dependency lookup
     Given an invalid connection configuration for a SQL Server database is used for lineage
@@ -0,0 +1,35 @@
+import os
+import shutil
+
+# --- Environment Control ---
+# Behave only picks up hooks from this file; step modules must not define them.
+
+def before_all(context):
+    # Read the test database configuration once per run instead of once per scenario.
+    # Values passed on the command line (e.g. behave -D db_server=...) take precedence.
+    userdata = context.config.userdata
+    userdata.setdefault('db_server', os.environ.get("TEST_DB_SERVER", "localhost\\SQLEXPRESS"))
+    userdata.setdefault('db_database', os.environ.get("TEST_DB_DATABASE", "TestDB"))
+    userdata.setdefault('db_user', os.environ.get("TEST_DB_USER", None)) # None for Win Auth
+    userdata.setdefault('db_password', os.environ.get("TEST_DB_PASSWORD", None)) # None for Win Auth
+
+    # Ensure the base test output directory exists; per-scenario subdirs are removed by after_scenario
+    base_test_output = os.path.join(os.path.dirname(__file__), "test_output_data")
+    os.makedirs(base_test_output, exist_ok=True)
+
+def before_scenario(context, scenario):
+    # Explicit per-scenario defaults so steps read plain attributes instead of probing with hasattr/getattr
+    context.server = None # Set by the connection setup steps
+    context.database = None # Set with the connection details; names the scenario's output dir
+    context.dependencies_queried = None
+    context.dot_file_created = None
+    context.lineage_error = None
+    context.render_error = None
+    context.export_success = None # True/False once export_schema has run
+    context.output_dir = None # Set once the database name is known
+    context.sql_file_buckets = None # Filled lazily by get_sql_file_buckets
+
+def after_scenario(context, scenario):
+    # Clean up only the output directory used in the scenario, if it was set
+    if context.output_dir is not None:
+        shutil.rmtree(context.output_dir, ignore_errors=True)
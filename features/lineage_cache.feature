@@ -0,0 +1,45 @@
+# Feature file for reusing unchanged lineage output
+
+Feature: Reuse unchanged lineage output
+
+  As a developer or DBA regenerating lineage maps regularly
+  I want unchanged dependencies to reuse the previous lineage output
+  So that repeated runs skip writing and rendering graphs that would come out identical.
+
+  # A stub connection serves canned dependency rows and rendering is replaced with a fake,
+  # so neither a database nor Graphviz is needed.
+  Background: Stub database and renderer
+    Given a stub connection returning a small set of dependencies
+    And Graphviz rendering is replaced with a fake renderer
+
+  Scenario: Reuse the output when the dependencies are unchanged
+    When lineage is generated from the stub connection
+    And lineage is generated from the stub connection
+    Then the lineage DOT file should have been written 1 time
+    And the lineage graph should have been rendered 1 time
+    And every lineage run should have reported success
+
+  Scenario: Regenerate the output when the dependencies change
+    When lineage is generated from the stub connection
+    And a procedure loading a table is added to the stub connection
+    And lineage is generated from the stub connection
+    Then the lineage DOT file should have been written 2 times
+    And the lineage graph should have been rendered 2 times
+    And every lineage run should have reported success
+
+  Scenario: Render when the previous run skipped rendering
+    When lineage is generated from the stub connection without rendering
+    And lineage is generated from the stub connection
+    Then the lineage DOT file should have been written 2 times
+    And the lineage graph should have been rendered 1 time
+    And a rendered image of the stub lineage graph should exist
+    And every lineage run should have reported success
+
+  Scenario: Regenerate without failing when the cache file cannot be written
+    Given the lineage cache file of the stub database cannot be written
+    When lineage is generated from the stub connection
+    And lineage is generated from the stub connection
+    Then the lineage DOT file should have been written 2 times
+    And the lineage graph should have been rendered 2 times
+    And a rendered image of the stub lineage graph should exist
+    And every lineage run should have reported success
@@ -0,0 +1,62 @@
+# Feature file for keeping tiled lineage output consistent between runs
+
+Feature: Keep tiled lineage output consistent
+
+  As a developer or DBA regenerating lineage maps of a changing database
+  I want each run to leave exactly the lineage files for the current schemas
+  So that tiles of schemas that are gone, or of a graph that is no longer tiled, don't linger.
+
+  # The tiling threshold is lowered so the stub's few objects are split per schema; as in
+  # lineage_cache.feature, neither a database nor Graphviz is needed.
+  Background: Stub database, renderer and a low tiling threshold
+    Given a stub connection returning a small set of dependencies
+    And Graphviz rendering is replaced with a fake renderer
+    And lineage graphs with more than 2 objects are tiled per schema
+
+  Scenario: Remove the tiles when the graph shrinks back to a single file
+    Given objects in schema "sales" are added to the stub connection
+    When lineage is generated from the stub connection
+    And the objects in schema "sales" are removed from the stub connection
+    And lineage is generated from the stub connection
+    Then the lineage output directory should contain exactly
+      | file                              |
+      | LineageCacheTestDB_lineage.gv     |
+      | LineageCacheTestDB_lineage.gv.svg |
+      | LineageCacheTestDB_lineage.hash   |
+    And every lineage run should have reported success
+
+  Scenario: Remove only the tile of a schema that disappears
+    Given objects in schema "sales" are added to the stub connection
+    And objects in schema "hr" are added to the stub connection
+    When lineage is generated from the stub connection
+    And a file named "LineageCacheTestDB_hr_lineage.gv.bak" is created in the lineage output directory
+    And the objects in schema "hr" are removed from the stub connection
+    And lineage is generated from the stub connection
+    Then the lineage output directory should contain exactly
+      | file                                    |
+      | LineageCacheTestDB_lineage.gv           |
+      | LineageCacheTestDB_lineage.gv.svg       |
+      | LineageCacheTestDB_lineage.hash         |
+      | LineageCacheTestDB_dbo_lineage.gv       |
+      | LineageCacheTestDB_dbo_lineage.gv.svg   |
+      | LineageCacheTestDB_sales_lineage.gv     |
+      | LineageCacheTestDB_sales_lineage.gv.svg |
+      | LineageCacheTestDB_hr_lineage.gv.bak    |
+    And every lineage run should have reported success
+
+  Scenario: Give schemas whose sanitized names collide separate tiles
+    Given objects in schema "a-b" are added to the stub connection
+    And objects in schema "a_b" are added to the stub connection
+    When lineage is generated from the stub connection
+    Then the lineage output directory should contain exactly
+      | file                                    |
+      | LineageCacheTestDB_lineage.gv           |
+      | LineageCacheTestDB_lineage.gv.svg       |
+      | LineageCacheTestDB_lineage.hash         |
+      | LineageCacheTestDB_dbo_lineage.gv       |
+      | LineageCacheTestDB_dbo_lineage.gv.svg   |
+      | LineageCacheTestDB_a_b_lineage.gv       |
+      | LineageCacheTestDB_a_b_lineage.gv.svg   |
+      | LineageCacheTestDB_a_b_lineage_2.gv     |
+      | LineageCacheTestDB_a_b_lineage_2.gv.svg |
+    And every lineage run should have reported success
@@ -0,0 +1,93 @@
+"""Output directory helpers shared by the step modules (behave loads both into one run)."""
+import functools
+import os
+from pathlib import Path
+from sql_schema_exporter._fsutil import sanitize_for_filename # Shared with cli.py (no pyodbc import)
+
+# General test output area (features/test_output_data), computed once at import
+_TEST_OUTPUT_BASE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "test_output_data")
+
+@functools.lru_cache(maxsize=64)
+def _compute_test_output_dir(db_name):
+    """Builds the sanitized output directory path for a database name (cached; Paths are immutable)."""
+    # Only wrap in a Path at the end, since the steps use the Path API on the result
+    return Path(os.path.join(_TEST_OUTPUT_BASE, sanitize_for_filename(db_name)))
+
+def get_test_output_dir(context):
+    """Gets the sanitized output directory path based on the test database name."""
+    # context.database starts as None (before_scenario); the connection setup steps set it first
+    assert context.database is not None, "context.database must be set before the output directory is known"
+    # Place it inside a general test output area to keep things tidy
+    return _compute_test_output_dir(context.database)
+
+def _remove_tree(path):
+    """Deletes a directory tree with one os.scandir pass per directory."""
+    with os.scandir(path) as it:
+        entries = list(it)
+    for entry in entries:
+        # DirEntry caches the type from the scandir call, so no extra stat per entry
+        if entry.is_dir(follow_symlinks=False):
+            _remove_tree(entry.path)
+        else:
+            os.unlink(entry.path)
+    os.rmdir(path)
+
+def clean_output_directory(output_dir):
+    """Removes the output directory if it exists."""
+    try:
+        # Probe for a first entry; the scandir also tells us whether the directory exists at all
+        with os.scandir(output_dir) as it:
+            is_empty = next(it, None) is None
+    except FileNotFoundError:
+        return
+    if is_empty:
+        os.rmdir(output_dir) # Common case between scenarios: one syscall, no tree walk
+    else:
+        _remove_tree(output_dir)
+    # The base test output directory is created once per run by before_all (features/environment.py)
+
+# --- Database Stand-ins ---
+# For scenarios that exercise connection handling or caching without a SQL Server instance.
+
+class FakeCursor:
+    """Minimal pyodbc cursor stand-in serving the canned rows of its FakeConnection."""
+    arraysize = 1
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._rows = []
+
+    def execute(self, query, *params):
+        if self.connection.error is not None:
+            raise self.connection.error
+        # Canned rows are looked up by the exact query text (e.g. lineage.DEPENDENCY_EDGES_QUERY)
+        self._rows = list(self.connection.rows_by_query.get(query, ()))
+        return self
+
+    def fetchmany(self, size=None):
+        size = size or self.arraysize
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    """
+    Minimal pyodbc connection stand-in. rows_by_query maps query text to the rows it returns;
+    setting error makes every query raise it (e.g. a pyodbc.Error for a dropped connection).
+    """
+    def __init__(self, rows_by_query=None):
+        self.rows_by_query = rows_by_query if rows_by_query is not None else {}
+        self.error = None
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
@@ -0,0 +1,97 @@
+from behave import *
+from unittest.mock import patch # For replacing pyodbc.connect with a fake
+
+import pyodbc
+from sql_schema_exporter import core # Import the core logic
+from _helpers import FakeConnection # Shared in-memory pyodbc stand-in
+
+# --- Fake Driver ---
+
+@given(u'pyodbc.connect is replaced with a fake connection factory')
+def step_impl(context):
+    context.opened_connections = []
+    def fake_connect(*args, **kwargs):
+        conn = FakeConnection()
+        context.opened_connections.append(conn)
+        return conn
+    # Patched for this scenario only; get_db_connection still builds the attributes as usual
+    patcher = patch.object(core.pyodbc, 'connect', side_effect=fake_connect)
+    patcher.start()
+    context.add_cleanup(patcher.stop)
+    context.pool_error = None
+
+def make_pool(context, **kwargs):
+    """Creates a pool against the fake driver, recording a ValueError instead of raising it."""
+    try:
+        context.pool = core.ConnectionPool('fake_server', 'FakeDB', None, None, **kwargs)
+    except ValueError as e:
+        context.pool = None
+        context.pool_error = e
+        return
+    context.add_cleanup(context.pool.close)
+
+# --- Given / When ---
+
+@given(u'a connection pool with a max_size of {max_size:d}')
+def step_impl(context, max_size):
+    make_pool(context, max_size=max_size)
+
+@when(u'a connection pool with a min_size of {min_size:d} and a max_size of {max_size:d} is created')
+def step_impl(context, min_size, max_size):
+    make_pool(context, min_size=min_size, max_size=max_size)
+
+@given(u'a connection was acquired and released')
+def step_impl(context):
+    with context.pool.acquire() as conn:
+        context.first_connection = conn
+
+@when(u'a connection is acquired and released {count:d} times')
+def step_impl(context, count):
+    for _ in range(count):
+        with context.pool.acquire():
+            pass
+
+@when(u'the pooled connection stops responding')
+def step_impl(context):
+    context.first_connection.error = pyodbc.Error('08S01', 'Communication link failure')
+
+@when(u'a connection is held while another is acquired with a timeout of {timeout:g} seconds')
+def step_impl(context, timeout):
+    with context.pool.acquire():
+        try:
+            with context.pool.acquire(timeout=timeout):
+                pass
+        except ConnectionError as e:
+            context.pool_error = e
+
+@when(u'a connection is acquired, the pool is closed, and the connection is released')
+def step_impl(context):
+    with context.pool.acquire():
+        context.pool.close()
+
+# --- Then ---
+
+@then(u'{count:d} connection should have been opened')
+@then(u'{count:d} connections should have been opened')
+def step_impl(context, count):
+    opened = len(context.opened_connections)
+    assert opened == count, f"Expected {count} connection(s) to be opened, but {opened} were."
+
+@then(u'the broken connection should have been closed')
+def step_impl(context):
+    assert context.first_connection.closed, "The connection that failed validation should have been closed."
+
+@then(u'the pool should report that no connection became available')
+def step_impl(context):
+    assert isinstance(context.pool_error, ConnectionError), \
+        f"Expected a ConnectionError for the timed-out checkout, but got: {context.pool_error!r}"
+
+@then(u'every opened connection should be closed')
+def step_impl(context):
+    still_open = [conn for conn in context.opened_connections if not conn.closed]
+    assert not still_open, f"{len(still_open)} connection(s) were left open after the pool was closed."
+
+@then(u'the pool should be rejected as invalid')
+def step_impl(context):
+    assert context.pool is None and isinstance(context.pool_error, ValueError), \
+        f"Expected a ValueError for the invalid pool sizes, but got: {context.pool_error!r}"
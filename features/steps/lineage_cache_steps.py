@@ -0,0 +1,99 @@
+import os
+from behave import *
+from unittest.mock import patch # For counting DOT writes and faking the renderer
+
+from sql_schema_exporter import lineage # Import the lineage logic
+from _helpers import FakeConnection, get_test_output_dir, clean_output_directory # Shared step helpers
+
+# Canned dependency rows, in the column order of DEPENDENCY_OBJECTS_QUERY / DEPENDENCY_EDGES_QUERY
+_OBJECT_ROWS = [
+    ('dbo', 'Orders', 'USER_TABLE', None),
+    ('dbo', 'OrderSummary', 'VIEW', None),
+]
+_EDGE_ROWS = [
+    ('dbo', 'OrderSummary', 'dbo', 'Orders'),
+]
+
+# --- Given ---
+
+@given(u'a stub connection returning a small set of dependencies')
+def step_impl(context):
+    context.stub_conn = FakeConnection({
+        lineage.DEPENDENCY_OBJECTS_QUERY: list(_OBJECT_ROWS),
+        lineage.DEPENDENCY_EDGES_QUERY: list(_EDGE_ROWS),
+    })
+    # Named like the other scenarios' output, so after_scenario removes it
+    context.database = 'LineageCacheTestDB'
+    context.output_dir = get_test_output_dir(context)
+    clean_output_directory(context.output_dir)
+    context.lineage_results = []
+
+@given(u'Graphviz rendering is replaced with a fake renderer')
+def step_impl(context):
+    def fake_render_all(dot_paths, fmt='svg', batch_size=lineage.RENDER_BATCH_SIZE, engine='dot'):
+        # Writes an empty image next to each DOT file, as 'dot -O' would
+        rendered = [f"{p}.{fmt}" for p in dot_paths]
+        for path in rendered:
+            open(path, 'w').close()
+        return rendered
+
+    patchers = [
+        patch.object(lineage, '_GRAPHVIZ_AVAILABLE', True),
+        patch.object(lineage, 'render_all', side_effect=fake_render_all),
+        # Wraps the real writer, only counting the calls
+        patch.object(lineage, 'write_lineage_tiles', wraps=lineage.write_lineage_tiles),
+    ]
+    context.render_mock, context.write_mock = [patcher.start() for patcher in patchers][1:]
+    for patcher in patchers:
+        context.add_cleanup(patcher.stop)
+
+@given(u'the lineage cache file of the stub database cannot be written')
+def step_impl(context):
+    # A directory in its place makes every open() of the hash file fail
+    os.makedirs(lineage.lineage_dot_path(context.output_dir, context.database).with_suffix('.hash'))
+
+# --- When ---
+
+def run_lineage(context, skip_render):
+    result = lineage.generate_lineage(None, context.database, None, None, context.output_dir,
+                                      skip_render=skip_render, conn=context.stub_conn)
+    context.lineage_results.append(result)
+
+@when(u'lineage is generated from the stub connection')
+def step_impl(context):
+    run_lineage(context, skip_render=False)
+
+@when(u'lineage is generated from the stub connection without rendering')
+def step_impl(context):
+    run_lineage(context, skip_render=True)
+
+@when(u'a procedure loading a table is added to the stub connection')
+def step_impl(context):
+    rows = context.stub_conn.rows_by_query
+    rows[lineage.DEPENDENCY_OBJECTS_QUERY].append(
+        ('dbo', 'LoadOrders', 'SQL_STORED_PROCEDURE', 'CREATE PROCEDURE dbo.LoadOrders AS INSERT INTO dbo.Orders SELECT * FROM dbo.Staging'))
+    rows[lineage.DEPENDENCY_EDGES_QUERY].append(('dbo', 'LoadOrders', 'dbo', 'Orders'))
+
+# --- Then ---
+
+@then(u'the lineage DOT file should have been written {count:d} time')
+@then(u'the lineage DOT file should have been written {count:d} times')
+def step_impl(context, count):
+    written = context.write_mock.call_count
+    assert written == count, f"Expected the DOT file to be written {count} time(s), but it was written {written} time(s)."
+
+@then(u'the lineage graph should have been rendered {count:d} time')
+@then(u'the lineage graph should have been rendered {count:d} times')
+def step_impl(context, count):
+    rendered = context.render_mock.call_count
+    assert rendered == count, f"Expected {count} render(s), but there were {rendered}."
+
+@then(u'a rendered image of the stub lineage graph should exist')
+def step_impl(context):
+    expected_file = f"{lineage.lineage_dot_path(context.output_dir, context.database)}.svg"
+    assert os.path.isfile(expected_file), f"Expected SVG file '{expected_file}' not found or is not a file."
+
+@then(u'every lineage run should have reported success')
+def step_impl(context):
+    for result in context.lineage_results:
+        assert result == (True, True, None), f"Expected (True, True, None) from generate_lineage, but got: {result}"
@@ -0,0 +1,45 @@
+import os
+from behave import *
+from unittest.mock import patch # For lowering the tiling threshold
+
+from sql_schema_exporter import lineage # Import the lineage logic
+
+# The stub connection, fake renderer and lineage runs come from lineage_cache_steps.py
+
+# --- Given ---
+
+@given(u'lineage graphs with more than {count:d} objects are tiled per schema')
+def step_impl(context, count):
+    patcher = patch.object(lineage, 'TILE_NODE_THRESHOLD', count)
+    patcher.start()
+    context.add_cleanup(patcher.stop)
+
+@given(u'objects in schema "{schema}" are added to the stub connection')
+def step_impl(context, schema):
+    # A table and a view reading it, in the column order of the dependency queries
+    rows = context.stub_conn.rows_by_query
+    rows[lineage.DEPENDENCY_OBJECTS_QUERY] += [
+        (schema, 'Customers', 'USER_TABLE', None),
+        (schema, 'CustomerSummary', 'VIEW', None),
+    ]
+    rows[lineage.DEPENDENCY_EDGES_QUERY].append((schema, 'CustomerSummary', schema, 'Customers'))
+
+# --- When ---
+
+@when(u'the objects in schema "{schema}" are removed from the stub connection')
+def step_impl(context, schema):
+    rows = context.stub_conn.rows_by_query
+    for query in (lineage.DEPENDENCY_OBJECTS_QUERY, lineage.DEPENDENCY_EDGES_QUERY):
+        rows[query] = [row for row in rows[query] if row[0] != schema]
+
+@when(u'a file named "{name}" is created in the lineage output directory')
+def step_impl(context, name):
+    open(os.path.join(context.output_dir, name), 'w').close()
+
+# --- Then ---
+
+@then(u'the lineage output directory should contain exactly')
+def step_impl(context):
+    expected = sorted(row['file'] for row in context.table)
+    actual = sorted(os.listdir(context.output_dir))
+    assert actual == expected, f"Expected lineage output {expected}, but found {actual}."
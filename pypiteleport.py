@@ -16,6 +16,14 @@ except ImportError:
         print("  pip install tomli")
         sys.exit(1)
 
+# Comment/format-preserving TOML editing for the version bump
+try:
+    import tomlkit
+except ImportError:
+    print("Error: 'tomlkit' package not found. Please install it:")
+    print("  pip install tomlkit")
+    sys.exit(1)
+
 PYPROJECT_PATH = Path("pyproject.toml")
 VERSION_REGEX = re.compile(
     r"""
@@ -104,24 +112,24 @@ def suggest_next_version(version_str: str) -> str | None:
 
 
 def update_pyproject_version(pyproject_path: Path, current_version: str, new_version: str):
-    """Updates the version string in pyproject.toml using regex."""
+    """Updates the version string in pyproject.toml, preserving its comments and formatting."""
     print(f"Updating {pyproject_path} from {current_version} to {new_version}...")
     try:
-        content = pyproject_path.read_text()
-        # Look for version = "..." or version = '...' under [project] or [tool.poetry]
-        # This is a bit simplistic but avoids messing up complex TOML structures
-        updated_content, count = re.subn(
-            rf'(version\s*=\s*["\']){re.escape(current_version)}(["\'])',
-            rf'\g<1>{new_version}\g<2>',
-            content,
-            count=1 # Only replace the first occurrence
-        )
-
-        if count == 0:
+        doc = tomlkit.parse(pyproject_path.read_text())
+        # Same lookup order as get_current_version: [project] first, then [tool.poetry]
+        table = None
+        if "project" in doc and "version" in doc["project"]:
+            table = doc["project"]
+        elif "tool" in doc and "poetry" in doc["tool"] and "version" in doc["tool"]["poetry"]:
+            table = doc["tool"]["poetry"]
+
+        if table is None or table["version"] != current_version:
             print(f"Error: Could not find 'version = \"{current_version}\"' in {pyproject_path} to replace.")
             print("Please check the file format.")
             sys.exit(1)
 
+        table["version"] = new_version
+        updated_content = tomlkit.dumps(doc)
         pyproject_path.write_text(updated_content)
         print(f"{pyproject_path} updated successfully.")
 
@@ -185,11 +193,11 @@ def main():
         commit_message = f"chore: Bump version to v{new_version}"
         tag_name = f"v{new_version}"
 
-        run_command(["git", "add", str(PYPROJECT_PATH)])
-        run_command(["git", "commit", "-m", commit_message])
+        # Committing the path directly stages it as part of the commit, so no separate `git add`
+        run_command(["git", "commit", "-m", commit_message, "--", str(PYPROJECT_PATH)])
         run_command(["git", "tag", tag_name])
-        run_command(["git", "push", "origin", current_branch])
-        run_command(["git", "push", "origin", tag_name])
+        # One push for branch and tag; --atomic updates both refs or neither
+        run_command(["git", "push", "--atomic", "origin", current_branch, tag_name])
 
         print("\n--- Success! ---")
         print(f"Version updated to {new_version}")
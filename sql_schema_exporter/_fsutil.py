@@ -0,0 +1,19 @@
+import functools
+
+# Characters that are invalid in file/directory names, plus all whitespace (str.isspace, as matched
+# by the regex \s this replaced; every such code point is <= U+3000). NUL is included since no
+# filesystem accepts it, which also makes it safe to use as the run marker below.
+_INVALID_FN_CHARS = '\\/*?:"<>|\0' + ''.join(c for c in map(chr, range(0x3001)) if c.isspace())
+# Translation table built once: every invalid character becomes a NUL marker
+_INVALID_FN_TABLE = str.maketrans(dict.fromkeys(_INVALID_FN_CHARS, '\0'))
+
+@functools.lru_cache(maxsize=128)
+def sanitize_for_filename(name):
+    """Removes or replaces characters invalid for filenames/directory names."""
+    # Strip surrounding whitespace, replace each run of invalid characters with a single
+    # underscore, and ensure the result is never empty
+    marked = name.strip().translate(_INVALID_FN_TABLE)
+    # Collapse runs of markers (halving each pass), so existing underscores are left as they are
+    while '\0\0' in marked:
+        marked = marked.replace('\0\0', '\0')
+    return marked.replace('\0', '_') or '_'
@@ -1,26 +1,14 @@
 import getpass
 import logging
-import re # Import regex for sanitization
 from pathlib import Path
 # Use absolute import instead of relative for direct script execution
-from sql_schema_exporter.core import export_schema
+from sql_schema_exporter.core import ConnectionPool, export_schema
+from sql_schema_exporter._fsutil import sanitize_for_filename # Shared with the behave steps
 from sql_schema_exporter.lineage import generate_lineage # Import lineage function
 
 # Setup logging (consistent with core)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# --- Helper Functions ---
-def sanitize_for_filename(name):
-    """Removes or replaces characters invalid for filenames/directory names."""
-    # Remove leading/trailing whitespace
-    name = name.strip()
-    # Replace sequences of invalid characters (including spaces) with a single underscore
-    name = re.sub(r'[\\/*?:"<>|\s]+', '_', name)
-    # Ensure it's not empty after sanitization
-    if not name:
-        return "_"
-    return name
-
 # --- Main Functions ---
 def get_connection_details_from_user():
     """Prompts the user for connection details."""
@@ -47,6 +35,32 @@ def get_connection_details_from_user():
 
     return server, database, username, password, output_dir
 
+def run_lineage(server, database, username, password, output_dir, conn=None):
+    """Generates the data lineage map and reports the outcome; lineage problems never fail the CLI."""
+    # Attempt to generate lineage map
+    print("\nAttempting to generate data lineage map...")
+    logging.info(f"Starting lineage generation for {database}...")
+    try:
+        deps_ok, dot_ok, render_err = generate_lineage(
+            server, database, username, password, output_dir, conn=conn
+        )
+        if deps_ok and dot_ok:
+            print(f"Lineage DOT graph saved in {output_dir.resolve()}")
+            if render_err:
+                print(f"Warning: {render_err}") # Report render error but don't fail exit code
+            else:
+                print(f"Lineage graph image rendered in {output_dir.resolve()}")
+        elif not deps_ok:
+             print("Lineage generation failed during dependency lookup. Check logs.")
+             # Consider if this should cause exit(1)? For now, just report.
+        else: # deps_ok but not dot_ok
+             print("Lineage generation failed while saving DOT file. Check logs.")
+
+    except Exception as lineage_e:
+        # Catch unexpected errors during lineage call itself
+        print(f"An unexpected error occurred during lineage generation: {lineage_e}")
+        logging.error(f"Lineage generation failed unexpectedly: {lineage_e}", exc_info=True)
+
 def main():
     """Main CLI entry point."""
     server, database, username, password, output_dir = get_connection_details_from_user()
@@ -56,35 +70,20 @@ def main():
     # Ensure output directory exists (optional, core.save_definitions also does this)
     # output_dir.mkdir(parents=True, exist_ok=True)
 
-    export_success = export_schema(server, database, username, password, output_dir)
-
-    if export_success:
-        print(f"\nSchema export completed successfully to {output_dir.resolve()}")
-        # Attempt to generate lineage map
-        print("\nAttempting to generate data lineage map...")
-        logging.info(f"Starting lineage generation for {database}...")
+    # One pooled connection serves both the schema export and the lineage lookup
+    export_success = False
+    with ConnectionPool(server, database, username, password, max_size=1) as pool:
         try:
-            deps_ok, dot_ok, render_err = generate_lineage(
-                server, database, username, password, output_dir
-            )
-            if deps_ok and dot_ok:
-                print(f"Lineage DOT graph saved in {output_dir.resolve()}")
-                if render_err:
-                    print(f"Warning: {render_err}") # Report render error but don't fail exit code
-                else:
-                    print(f"Lineage graph image rendered in {output_dir.resolve()}")
-            elif not deps_ok:
-                 print("Lineage generation failed during dependency lookup. Check logs.")
-                 # Consider if this should cause exit(1)? For now, just report.
-            else: # deps_ok but not dot_ok
-                 print("Lineage generation failed while saving DOT file. Check logs.")
-
-        except Exception as lineage_e:
-            # Catch unexpected errors during lineage call itself
-            print(f"An unexpected error occurred during lineage generation: {lineage_e}")
-            logging.error(f"Lineage generation failed unexpectedly: {lineage_e}", exc_info=True)
+            with pool.acquire() as conn:
+                export_success = export_schema(server, database, username, password, output_dir, conn=conn)
+                if export_success:
+                    print(f"\nSchema export completed successfully to {output_dir.resolve()}")
+                    run_lineage(server, database, username, password, output_dir, conn=conn)
+        except ConnectionError as e:
+            # Connection errors already logged by get_db_connection; reported as an export failure below
+            logging.error(f"Export failed due to connection error: {e}")
 
-    else:
+    if not export_success:
         print("\nSchema export failed. Check logs for details.")
         # Exit with a non-zero code to indicate failure
         exit(1)
@@ -1,35 +1,81 @@
+import contextlib
+import itertools
+import operator
 import os
 import pyodbc
 import logging
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- Database Connection ---
+# Let the ODBC driver manager pool connections, so repeated connects with the same connection string
+# (e.g. exporting several databases on one server) skip the full login handshake. This is pyodbc's
+# default, but it only takes effect if set before the first connect, so it is pinned here explicitly.
+pyodbc.pooling = True
+
+_DRIVER_NAME = re.compile(r'ODBC Driver (\d+) for SQL Server')
+
+_DEFAULT_DRIVER_VERSION = 17
+
+def _detect_sql_driver():
+    """
+    Returns the ODBC driver to connect with: SQL_EXPORTER_ODBC_DRIVER if set, else driver 17 when it
+    is installed, else the newest installed 'ODBC Driver N for SQL Server' (driver 17 if none is found).
+    """
+    override = os.environ.get('SQL_EXPORTER_ODBC_DRIVER')
+    if override:
+        return override
+    versions = {}
+    for name in pyodbc.drivers():
+        match = _DRIVER_NAME.fullmatch(name)
+        if match:
+            versions[int(match.group(1))] = name
+    if not versions:
+        return f'ODBC Driver {_DEFAULT_DRIVER_VERSION} for SQL Server'
+    # Driver 18+ encrypts by default (Encrypt=yes) and rejects self-signed server certificates,
+    # so 17 stays preferred wherever it is installed; newer drivers are used only without it
+    return versions.get(_DEFAULT_DRIVER_VERSION, versions[max(versions)])
+
+# Detected once at import rather than hardcoding driver 17, which fails on machines that only have 18
+_SQL_DRIVER = _detect_sql_driver()
+
+# Optional connection-string overrides for encryption, e.g. SQL_EXPORTER_TRUST_SERVER_CERTIFICATE=yes
+# to reach a server with a self-signed certificate through driver 18
+_ENCRYPTION_ENV = {
+    'Encrypt': 'SQL_EXPORTER_ENCRYPT',
+    'TrustServerCertificate': 'SQL_EXPORTER_TRUST_SERVER_CERTIFICATE',
+}
+
 def get_db_connection(server, database, username, password):
     """Establishes a connection to the SQL Server database using provided details."""
-    # NOTE: Ensure the DRIVER name matches the one registered in your odbcinst.ini
-    # Common names: {ODBC Driver 17 for SQL Server}, {ODBC Driver 18 for SQL Server}, {msodbcsql17}
-    # Check your system's ODBC configuration if connection fails with 'driver not found'.
-    conn_str = [
-        f'DRIVER={{ODBC Driver 17 for SQL Server}}',
-        f'SERVER={server}',
-        f'DATABASE={database}',
-    ]
+    # pyodbc.connect turns these keywords into the KEY=value; connection string
+    attrs = {
+        'DRIVER': f'{{{_SQL_DRIVER}}}',
+        'SERVER': server,
+        'DATABASE': database,
+    }
     if username:
-        conn_str.append(f'UID={username}')
+        attrs['UID'] = username
         # Only add PWD if password is provided (it might be empty for some auth methods)
         if password is not None:
-             conn_str.append(f'PWD={password}')
+             attrs['PWD'] = password
     else:
         # Use Windows Authentication (Trusted Connection)
-        conn_str.append('Trusted_Connection=yes')
+        attrs['Trusted_Connection'] = 'yes'
+    for keyword, env_var in _ENCRYPTION_ENV.items():
+        value = os.environ.get(env_var)
+        if value:
+            attrs[keyword] = value
 
-    connection_string = ';'.join(conn_str)
     logging.info(f"Connecting to {server}/{database}...")
     try:
-        conn = pyodbc.connect(connection_string, autocommit=True) # Autocommit often useful for scripts
+        conn = pyodbc.connect(autocommit=True, **attrs) # Autocommit often useful for scripts
         logging.info("Connection successful.")
         return conn
     except pyodbc.Error as ex:
@@ -38,95 +84,225 @@ def get_db_connection(server, database, username, password):
         # Re-raise a more specific exception or return None to indicate failure
         raise ConnectionError(f"Database connection failed: {ex}") from ex
 
-# --- Extraction Functions ---
-def fetch_objects(conn, object_type_code, output_subdir, output_dir_base):
-    """Fetches definitions for a given object type (View or Stored Procedure)."""
-    cursor = conn.cursor()
-    # Using INFORMATION_SCHEMA.ROUTINES for broader compatibility (includes functions)
-    # and OBJECT_DEFINITION for the actual source.
-    query = """
-    SELECT
-        ROUTINE_SCHEMA,
-        ROUTINE_NAME,
-        OBJECT_DEFINITION(OBJECT_ID(QUOTENAME(ROUTINE_SCHEMA) + '.' + QUOTENAME(ROUTINE_NAME))) AS definition
-    FROM INFORMATION_SCHEMA.ROUTINES
-    WHERE ROUTINE_TYPE = ? -- 'PROCEDURE' or 'FUNCTION' (OBJECT_DEFINITION works for Views too)
-    ORDER BY ROUTINE_SCHEMA, ROUTINE_NAME;
+class ConnectionPool:
     """
-    # Adjust query and parameters for Views
-    object_type_name = "Stored Procedures"
-    param = 'PROCEDURE'
-    if object_type_code == 'V':
-        query = """
-        SELECT
-            TABLE_SCHEMA,
-            TABLE_NAME,
-            VIEW_DEFINITION
-        FROM INFORMATION_SCHEMA.VIEWS
-        ORDER BY TABLE_SCHEMA, TABLE_NAME;
-        """
-        param = None # No parameter needed for the view query
-        object_type_name = "Views"
-
-
-    logging.info(f"Fetching {object_type_name} definitions...")
-    try:
-        if param:
-            cursor.execute(query, param)
-        else:
-            cursor.execute(query) # For Views
-
-        objects = cursor.fetchall()
-        logging.info(f"Found {len(objects)} {object_type_name}.")
-        save_definitions(objects, output_subdir, output_dir_base)
-        return objects # Return fetched objects for potential use/testing
-    except pyodbc.Error as ex:
-        logging.error(f"Error fetching {object_type_name}: {ex}")
-        return [] # Return empty list on error
-    finally:
-        cursor.close()
+    Thread-safe pool of open connections to one database, backed by a queue.Queue.
+    Connections are opened on demand up to max_size (min_size of them up front) and checked with
+    validate_query when handed out, so a connection dropped by the server is replaced transparently.
+    Use as: with pool.acquire() as conn: ...  Call close() (or use the pool as a context manager)
+    to close the idle connections.
+    """
+    def __init__(self, server, database, username, password, min_size=0, max_size=4, validate_query='SELECT 1'):
+        if max_size < 1 or not 0 <= min_size <= max_size:
+            raise ValueError(f"ConnectionPool needs 0 <= min_size <= max_size and max_size >= 1, got min_size={min_size}, max_size={max_size}")
+        self._connect_args = (server, database, username, password)
+        self.max_size = max_size
+        self.validate_query = validate_query # None skips validation on checkout
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._open_count = 0
+        self._closed = False
+        for _ in range(min_size):
+            self._idle.put(self._open())
 
-def fetch_tables(conn, output_subdir, output_dir_base):
-    """Fetches table names and creates placeholder files."""
-    cursor = conn.cursor()
-    query = """
-    SELECT TABLE_SCHEMA, TABLE_NAME
+    def _open(self):
+        """Opens a new connection, counting it against max_size."""
+        with self._lock:
+            if self._open_count >= self.max_size:
+                return None
+            self._open_count += 1
+        try:
+            return get_db_connection(*self._connect_args)
+        except Exception:
+            with self._lock:
+                self._open_count -= 1
+            raise
+
+    def _discard(self, conn):
+        """Closes a connection that won't be returned to the pool."""
+        with self._lock:
+            self._open_count -= 1
+        try:
+            conn.close()
+        except pyodbc.Error:
+            pass # Already broken; nothing more to release
+
+    def _is_usable(self, conn):
+        """Runs validate_query on conn; False if the connection no longer works."""
+        if not self.validate_query:
+            return True
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.validate_query).fetchall()
+            return True
+        except pyodbc.Error as ex:
+            logging.warning(f"Discarding pooled connection that failed validation: {ex}")
+            return False
+        finally:
+            if cursor:
+                cursor.close()
+
+    def _checkout(self, timeout):
+        if self._closed:
+            raise ConnectionError("Connection pool is closed")
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open()
+                if conn is not None:
+                    return conn # Freshly opened, no need to validate
+                try:
+                    # At max_size: wait for another caller to release one
+                    conn = self._idle.get(timeout=timeout)
+                except queue.Empty:
+                    raise ConnectionError(f"No pooled connection became available within {timeout} seconds") from None
+            if self._is_usable(conn):
+                return conn
+            self._discard(conn)
+
+    @contextlib.contextmanager
+    def acquire(self, timeout=None):
+        """Checks out a connection for the duration of the with block, returning it to the pool after."""
+        conn = self._checkout(timeout)
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def _release(self, conn):
+        """Returns conn to the idle queue, or closes it if the pool was closed while it was out."""
+        with self._lock:
+            if not self._closed:
+                self._idle.put(conn)
+                return
+        self._discard(conn)
+
+    def close(self):
+        """Closes every idle connection in the pool; connections still checked out are closed on release."""
+        with self._lock:
+            # Set under the lock _release checks it with, so no connection is queued after the drain below
+            self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+        logging.info("Database connection pool closed.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# --- Extraction Functions ---
+# Rows pulled per fetchmany() call when streaming definitions to disk
+FETCH_BATCH_SIZE = 200
+
+def _iter_rows(cursor):
+    """Yields rows from an executed cursor, fetching cursor.arraysize rows at a time."""
+    while True:
+        rows = cursor.fetchmany()
+        if not rows:
+            break
+        yield from rows
+
+# Object type code (first column of SCHEMA_OBJECTS_QUERY) -> output subdirectory
+_SUBDIR = {'P': 'sprocs', 'V': 'views', 'U': 'tables'}
+
+# Procedures and views come from one scan of sys.sql_modules (reading the definition directly
+# instead of evaluating OBJECT_DEFINITION per row); base tables are appended with a NULL definition,
+# since their CREATE TABLE is generated afterwards. Tables sort last so their rows are the final
+# batch: they must be drained before get_table_definition can reuse the connection (no MARS).
+SCHEMA_OBJECTS_QUERY = """
+SELECT kind, schema_name, object_name, definition
+FROM (
+    SELECT
+        RTRIM(o.type) AS kind, -- sys.objects.type is CHAR(2), e.g. 'P '
+        s.name AS schema_name,
+        o.name AS object_name,
+        m.definition
+    FROM sys.sql_modules m
+    JOIN sys.objects o ON m.object_id = o.object_id
+    JOIN sys.schemas s ON o.schema_id = s.schema_id
+    WHERE o.type IN ('P', 'V')
+    UNION ALL
+    SELECT 'U', TABLE_SCHEMA, TABLE_NAME, NULL
     FROM INFORMATION_SCHEMA.TABLES
     WHERE TABLE_TYPE = 'BASE TABLE'
-    ORDER BY TABLE_SCHEMA, TABLE_NAME;
+) AS objects
+ORDER BY CASE kind WHEN 'U' THEN 1 ELSE 0 END, kind, schema_name, object_name;
+"""
+
+def fetch_schema_objects(conn, output_dir_base):
     """
-    logging.info(f"Fetching table names...")
+    Fetches stored procedures, views and table names in a single round trip and streams each
+    kind to its subdirectory as rows arrive. Returns a dict of subdir -> number of files saved.
+    """
+    counts = dict.fromkeys(_SUBDIR.values(), 0)
+    cursor = conn.cursor()
+    cursor.arraysize = FETCH_BATCH_SIZE
+    logging.info("Fetching stored procedure, view and table definitions...")
     try:
-        cursor.execute(query)
-        tables = cursor.fetchall()
-        logging.info(f"Found {len(tables)} tables.")
-        # Pass conn so save_definitions can call get_table_definition
-        save_definitions(tables, output_subdir, output_dir_base, conn=conn)
-        return tables # Return fetched table names
+        cursor.execute(SCHEMA_OBJECTS_QUERY)
+        # Rows arrive grouped by kind; each group is written as its batches arrive
+        for kind, rows in itertools.groupby(_iter_rows(cursor), key=operator.itemgetter(0)):
+            subdir = _SUBDIR[kind]
+            # Drop the kind column so rows match the (schema, name, definition) layout save_definitions expects
+            rows = (row[1:] for row in rows)
+            if kind == 'U':
+                # Names only, so fetching them all is cheap. It also frees the connection (no MARS, so
+                # one active result set at a time) and this cursor, which then runs every column query.
+                tables = list(rows)
+                logging.info(f"Found {len(tables)} tables.")
+                counts[subdir] = save_definitions(tables, subdir, output_dir_base, conn=conn, cursor=cursor)
+            else:
+                counts[subdir] = save_definitions(rows, subdir, output_dir_base)
+        for subdir, count in counts.items():
+            logging.info(f"Exported {count} {subdir}.")
     except pyodbc.Error as ex:
-        logging.error(f"Error fetching table names: {ex}")
-        return [] # Return empty list on error
+        logging.error(f"Error fetching schema objects: {ex}")
     finally:
         cursor.close()
+    return counts
 
 # --- Table Definition Generation ---
+# Column metadata for one table, alongside the other query constants. pyodbc re-prepares a
+# parameterized statement only when a different SQL string object is executed on the cursor, so it
+# is the shared export cursor (see fetch_schema_objects) that lets this be prepared once per export.
+TABLE_COLUMNS_QUERY = """
+SELECT COLUMN_NAME, DATA_TYPE, IS_NULLABLE, COLUMN_DEFAULT,
+       CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE, DATETIME_PRECISION
+FROM INFORMATION_SCHEMA.COLUMNS
+WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?
+ORDER BY ORDINAL_POSITION;
+"""
 
-def get_table_definition(conn, schema_name, table_name):
-    """Generates a CREATE TABLE statement for a given table."""
-    cursor = conn.cursor()
+def get_table_definition(conn, schema_name, table_name, cursor=None):
+    """
+    Generates a CREATE TABLE statement for a given table.
+    Pass an idle cursor to run the column query on it instead of opening (and closing) one per table.
+    """
+    owns_cursor = cursor is None
+    if owns_cursor:
+        cursor = conn.cursor()
+    try:
+        return _build_table_definition(cursor, schema_name, table_name)
+    finally:
+        if owns_cursor:
+            cursor.close()
+
+def _build_table_definition(cursor, schema_name, table_name):
+    """Runs the column query for get_table_definition on cursor and assembles the statement."""
     parts = [f"CREATE TABLE [{schema_name}].[{table_name}] ("]
 
     # Get Columns
     column_defs = []
     try:
-        col_query = """
-        SELECT COLUMN_NAME, DATA_TYPE, IS_NULLABLE, COLUMN_DEFAULT,
-               CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE, DATETIME_PRECISION
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?
-        ORDER BY ORDINAL_POSITION;
-        """
-        cursor.execute(col_query, schema_name, table_name)
+        cursor.execute(TABLE_COLUMNS_QUERY, schema_name, table_name)
         for col in cursor.fetchall():
             name, dtype, nullable, default, char_len, num_prec, num_scale, dt_prec = col
             col_def = f"    [{name}] {dtype.upper()}"
@@ -173,74 +349,131 @@ def get_table_definition(conn, schema_name, table_name):
 
 
 # --- File Writing ---
-def save_definitions(objects, subdir, output_dir_base, create_placeholders=False, conn=None):
-    """Saves the fetched definitions or creates placeholders/definitions."""
+# Batch separator appended to every procedure/view definition, pre-encoded once
+_GO_SUFFIX = b"\nGO"
+
+# Writer threads used by save_definitions; small-file writes are syscall-bound and release the GIL
+WRITE_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# Max writes queued or running at once, so only this many encoded payloads are held in memory
+MAX_PENDING_WRITES = WRITE_WORKERS * 4
+
+class _ObjectNameTable(dict):
+    """
+    str.translate table that maps every character except alphanumerics, '.' and '_' to '_'.
+    ASCII is pre-populated at import; any other code point is classified with str.isalnum()
+    the first time it is seen and cached, so the whole Unicode range is covered lazily.
+    """
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        value = codepoint if char.isalnum() or char in '._' else '_'
+        self[codepoint] = value
+        return value
+
+_OBJECT_NAME_TABLE = _ObjectNameTable()
+for _codepoint in range(128):
+    _OBJECT_NAME_TABLE[_codepoint] # Populates the ASCII entries via __missing__
+del _codepoint
+
+def _write_file(file_path, payload):
+    """
+    Writes already-encoded bytes to file_path with unbuffered os.write, so even a multi-MB
+    definition normally goes out in one syscall. No O_SYNC/O_DSYNC: the OS handles durability.
+    """
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        written = os.write(fd, payload)
+        if written < len(payload):
+            # Short write (possible for very large payloads); finish without copying the bytes
+            view = memoryview(payload)
+            while written < len(view):
+                written += os.write(fd, view[written:])
+    finally:
+        os.close(fd)
+
+def save_definitions(objects, subdir, output_dir_base, create_placeholders=False, conn=None, cursor=None):
+    """
+    Saves the fetched definitions or creates placeholders/definitions.
+    objects may be any iterable of rows (e.g. a streaming cursor); each file is handed to a
+    writer thread as its row is consumed. Returns the number of files saved.
+    For tables, an idle cursor on conn may be passed to run every column query on.
+    """
     # conn is needed only when generating table defs on the fly
     output_path = Path(output_dir_base) / subdir
-    output_path.mkdir(parents=True, exist_ok=True) # Create subdir if not exists
+    # Create the subdir once up front so the writer threads never race on mkdir
+    output_path.mkdir(parents=True, exist_ok=True)
+    # Every file shares this directory, so paths in the loop below are a single string format
+    out_prefix = f"{output_path}{os.sep}"
 
-    count = 0
-    for item in objects:
-        schema_name = item[0]
-        object_name = item[1]
-        # Sanitize names slightly in case they contain invalid characters for filenames
-        safe_object_name = "".join(c if c.isalnum() or c in ('.', '_') else '_' for c in object_name)
-        file_name = f"{schema_name}.{safe_object_name}.sql"
-        file_name = f"{schema_name}.{safe_object_name}.sql"
-        file_path = output_path / file_name
-
-        content = ""
-        if subdir == 'tables':
-            # Generate table definition instead of using placeholder
-            if conn:
-                 try:
-                     content = get_table_definition(conn, schema_name, object_name)
-                 except Exception as e:
-                     logging.error(f"Failed to generate definition for table {schema_name}.{object_name}: {e}")
-                     content = f"-- Failed to generate definition for table {schema_name}.{object_name}\n-- Error: {e}\nGO"
+    writes = {} # future -> file_path, for error reporting once the pool has drained
+    # The executor's work queue is unbounded; this caps how many payloads wait in it, so reading rows
+    # blocks while the writers catch up instead of buffering the whole result set
+    pending = threading.BoundedSemaphore(MAX_PENDING_WRITES)
+    with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as executor:
+        for item in objects:
+            schema_name = item[0]
+            object_name = item[1]
+            # Sanitize names slightly in case they contain invalid characters for filenames
+            safe_object_name = object_name.translate(_OBJECT_NAME_TABLE)
+            file_path = f"{out_prefix}{schema_name}.{safe_object_name}.sql"
+
+            # Payloads are built as UTF-8 bytes, ready for a single os.write
+            if subdir == 'tables':
+                # Generate table definition instead of using placeholder
+                if conn:
+                     try:
+                         content = get_table_definition(conn, schema_name, object_name, cursor=cursor)
+                     except Exception as e:
+                         logging.error(f"Failed to generate definition for table {schema_name}.{object_name}: {e}")
+                         content = f"-- Failed to generate definition for table {schema_name}.{object_name}\n-- Error: {e}\nGO"
+                else:
+                     # Fallback if connection isn't passed (shouldn't happen with current flow)
+                     content = f"-- Connection object not available to generate definition for table {schema_name}.{object_name}\nGO"
+                payload = content.encode('utf-8')
             else:
-                 # Fallback if connection isn't passed (shouldn't happen with current flow)
-                 content = f"-- Connection object not available to generate definition for table {schema_name}.{object_name}\nGO"
-        else:
-             # Existing logic for Sprocs and Views
-             # item[2] should be the definition
-             definition = item[2]
-             if definition:
-                 content = definition.strip()
-                 # Add GO statement for SQL Server Management Studio compatibility if desired
-                 content += "\nGO"
-             else:
-                 logging.warning(f"No definition found for {subdir} {schema_name}.{object_name}")
-                 content = f"-- No definition found for {schema_name}.{object_name}\nGO"
+                 # Existing logic for Sprocs and Views
+                 # item[2] should be the definition
+                 definition = item[2]
+                 if definition:
+                     # Add GO statement for SQL Server Management Studio compatibility if desired
+                     payload = definition.strip().encode('utf-8') + _GO_SUFFIX
+                 else:
+                     logging.warning(f"No definition found for {subdir} {schema_name}.{object_name}")
+                     payload = f"-- No definition found for {schema_name}.{object_name}\nGO".encode('utf-8')
+
+            pending.acquire()
+            future = executor.submit(_write_file, file_path, payload)
+            future.add_done_callback(lambda _: pending.release())
+            writes[future] = file_path
 
+    count = 0
+    for future, file_path in writes.items():
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            logging.debug(f"Saved definition to {file_path}")
-            count += 1
+            future.result()
+            count += 1 # Reported once in the summary below rather than logged per file
         except IOError as e:
             logging.error(f"Error writing file {file_path}: {e}")
     logging.info(f"Saved {count} files to {output_path}")
+    return count
 
 
 # --- Main Orchestration Function ---
-def export_schema(server, database, username, password, output_dir):
-    """Connects to the DB and exports schema objects."""
-    conn = None
+def export_schema(server, database, username, password, output_dir, conn=None):
+    """
+    Connects to the DB and exports schema objects.
+    Pass an open conn to reuse it across several exports; it is left open for the caller to close.
+    """
+    owns_conn = conn is None
     try:
-        conn = get_db_connection(server, database, username, password)
-        if conn:
-            logging.debug("Connection established. Fetching stored procedures...")
-            fetch_objects(conn, 'P', 'sprocs', output_dir)
-
-            logging.debug("Fetching views...")
-            fetch_objects(conn, 'V', 'views', output_dir)
+        if owns_conn:
+            conn = get_db_connection(server, database, username, password)
+        # Every kind gets its directory, even when the database has none of that kind
+        for subdir in _SUBDIR.values():
+            os.makedirs(os.path.join(output_dir, subdir), exist_ok=True)
 
-            logging.debug("Fetching tables...")
-            fetch_tables(conn, 'tables', output_dir) # fetch_tables now calls save_definitions internally
+        fetch_schema_objects(conn, output_dir)
 
-            logging.info("Schema export process completed successfully.")
-            return True # Indicate success
+        logging.info("Schema export process completed successfully.")
+        return True # Indicate success
     except ConnectionError as e:
         # Connection errors already logged by get_db_connection
         logging.error(f"Export failed due to connection error: {e}") # Add context
@@ -254,6 +487,6 @@ def export_schema(server, database, username, password, output_dir):
         logging.error(f"An unexpected non-database error occurred during export: {e}", exc_info=True) # Log traceback
         return False # Indicate failure due to other error
     finally:
-        if conn:
+        if owns_conn and conn:
             conn.close()
             logging.info("Database connection closed.")
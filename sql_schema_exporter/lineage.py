@@ -1,10 +1,19 @@
+import contextlib
+import functools
+import hashlib
 import logging
 import os
 import pyodbc
+import queue
 import re # For cleaning identifiers
+import shutil # For locating the Graphviz executable
+import subprocess # For batched 'dot' rendering
+import sys
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from graphviz import Digraph
-from graphviz.backend.execute import ExecutableNotFound
 import sqlparse # Import sqlparse
 
 # Import connection function from core
@@ -16,6 +25,25 @@ log = logging.getLogger(__name__)
 if not log.handlers:
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Probe for the Graphviz 'dot' executable once at import time rather than on every render
+_GRAPHVIZ_AVAILABLE = shutil.which('dot') is not None
+
+# Max DOT files per 'dot' process in render_all; keeps argv well under the Windows command-line limit
+RENDER_BATCH_SIZE = 100
+
+# Graphviz output formats a lineage DOT file may have been rendered to ('<file>.gv.<format>');
+# _remove_stale_outputs deletes renderings with these suffixes and leaves other files alone
+RENDERED_IMAGE_FORMATS = ('svg', 'png', 'pdf', 'jpg', 'jpeg', 'gif', 'bmp', 'ps', 'eps')
+
+# Graphs with more nodes than this are split into one DOT file per schema plus a cross-schema index
+# (see write_lineage_tiles); 'dot' layout cost grows super-linearly, so several small layouts that
+# render in parallel finish far sooner than one huge one
+TILE_NODE_THRESHOLD = 2000
+
+# Above this many direct dependencies generate_lineage lays graphs out with 'sfdp' (scalable
+# force-directed placement) instead of 'dot', whose hierarchical layout stops scaling well
+SFDP_DEPENDENCY_THRESHOLD = 5000
+
 
 # --- SQL Parsing Helper ---
 
@@ -147,154 +175,242 @@ def _parse_sql_for_io(sql_definition):
 
 
 # --- Dependency Query ---
-def fetch_dependencies(conn):
+# Rows pulled per fetchmany() call in fetch_dependencies. Object rows carry the full definition of
+# procedures/functions, so their batches are kept moderate; edge rows are four names each, so they
+# are pulled in much larger batches to cut per-call overhead.
+DEPENDENCY_BATCH_SIZE = 1000
+DEPENDENCY_EDGE_BATCH_SIZE = 10000
+# Fetched batches the background reader may hold ahead of the parser in fetch_dependencies
+PREFETCH_QUEUE_SIZE = 8
+
+# Shared by both dependency queries: the objects we graph, and the distinct same-database
+# (referencing, referenced) pairs between them
+_DEPENDENCY_CTE = """
+WITH ObjectInfo AS (
+    SELECT schema_id, object_id, name, type, type_desc
+    FROM sys.objects
+    WHERE type IN ('U', 'V', 'P', 'IF', 'FN', 'TF') -- User Tables, Views, Procs, Functions
+),
+Deps AS (
+    SELECT DISTINCT sed.referencing_id, sed.referenced_id
+    FROM sys.sql_expression_dependencies sed
+    JOIN ObjectInfo oi_ref ON sed.referencing_id = oi_ref.object_id
+    JOIN ObjectInfo oi_target ON sed.referenced_id = oi_target.object_id
+    WHERE sed.referenced_database_name IS NULL
+      AND sed.referenced_server_name IS NULL
+)
+"""
+
+# Every object that takes part in a dependency, once, with the definition of referencing
+# procedures/functions (for parsing source/target flow) read once per object.
+# Neither dependency query has an ORDER BY: nothing downstream relies on row order (the output
+# cache hash sorts its input), so SQL Server can stream rows without a Sort operator.
+DEPENDENCY_OBJECTS_QUERY = _DEPENDENCY_CTE + """
+SELECT
+    schema_name = SCHEMA_NAME(oi.schema_id),
+    object_name = oi.name,
+    object_type = oi.type_desc,
+    definition = CASE
+                     WHEN oi.type IN ('P', 'IF', 'FN', 'TF') -- Only get definition for procs/funcs
+                          AND EXISTS (SELECT 1 FROM Deps d WHERE d.referencing_id = oi.object_id)
+                     THEN m.definition
+                 END
+FROM ObjectInfo oi
+LEFT JOIN sys.sql_modules m ON m.object_id = oi.object_id
+WHERE EXISTS (SELECT 1 FROM Deps d WHERE d.referencing_id = oi.object_id OR d.referenced_id = oi.object_id);
+"""
+
+# The dependency edges themselves, names only
+DEPENDENCY_EDGES_QUERY = _DEPENDENCY_CTE + """
+SELECT
+    referencing_schema_name = SCHEMA_NAME(oi_ref.schema_id),
+    referencing_object_name = oi_ref.name,
+    referenced_schema_name = SCHEMA_NAME(oi_target.schema_id),
+    referenced_object_name = oi_target.name
+FROM Deps d
+JOIN ObjectInfo oi_ref ON d.referencing_id = oi_ref.object_id
+JOIN ObjectInfo oi_target ON d.referenced_id = oi_target.object_id;
+"""
+
+_PREFETCH_END = object() # Marks the end of a _prefetch stream
+
+def _prefetch(items, maxsize=PREFETCH_QUEUE_SIZE):
+    """
+    Yields from the items iterable while a background thread pulls up to maxsize items ahead,
+    so waits inside items (e.g. pyodbc fetches, which release the GIL) overlap with the caller's
+    processing. An exception raised by items is re-raised here. Close the generator to stop early.
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def produce():
+        error = None
+        try:
+            for item in items:
+                buffer.put((item, None))
+                if stop.is_set():
+                    return
+        except BaseException as e:
+            error = e
+        buffer.put((_PREFETCH_END, error))
+
+    reader = threading.Thread(target=produce, name='lineage-prefetch', daemon=True)
+    reader.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is _PREFETCH_END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # Unblock the reader if the consumer stopped early, then wait for it to finish
+        stop.set()
+        while reader.is_alive():
+            try:
+                buffer.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+def _dependency_batches(cursor):
+    """Runs both dependency queries on cursor in turn, yielding ('objects' | 'edges', rows) batches."""
+    cursor.arraysize = DEPENDENCY_BATCH_SIZE
+    cursor.execute(DEPENDENCY_OBJECTS_QUERY)
+    for rows in iter(cursor.fetchmany, []):
+        yield 'objects', rows
+    # The objects result is fully consumed, so the connection is free for the next query (no MARS)
+    cursor.arraysize = DEPENDENCY_EDGE_BATCH_SIZE
+    cursor.execute(DEPENDENCY_EDGES_QUERY)
+    for rows in iter(cursor.fetchmany, []):
+        yield 'edges', rows
+
+def fetch_dependencies(conn, cursor=None):
     """
-    Queries sys.sql_expression_dependencies and also fetches definitions
-    of referencing procedures/functions to parse for source/target relationships.
-    Returns a dictionary containing 'direct_deps' and 'parsed_flow'.
+    Queries sys.sql_expression_dependencies for the objects involved and the edges between them,
+    and parses the definitions of referencing procedures/functions for source/target relationships.
+    Returns a dictionary containing:
+      'objects': [(schema, name, type_desc)], one per object in a dependency
+      'direct_deps': [(referencing_full_name, referenced_full_name)]
+      'parsed_flow': {proc_full_name: {'sources': set(), 'targets': set()}}
+    Pass an idle cursor on conn to run both queries on it; it is left open for the caller.
     """
-    cursor = conn.cursor()
+    owns_cursor = cursor is None
+    if owns_cursor:
+        cursor = conn.cursor()
+    objects = []
     direct_dependencies = []
     parsed_flow_details = {} # Store {proc_name: {'sources': set(), 'targets': set()}}
+    intern = sys.intern
 
-    # Query to get dependencies AND the definition of the referencing object if it's a proc/func
-    query = """
-    WITH ObjectInfo AS (
-        SELECT schema_id, object_id, name, type, type_desc
-        FROM sys.objects
-        WHERE type IN ('U', 'V', 'P', 'IF', 'FN', 'TF') -- User Tables, Views, Procs, Functions
-    )
-    SELECT DISTINCT
-        referencing_schema_name = SCHEMA_NAME(oi_ref.schema_id),
-        referencing_object_name = oi_ref.name,
-        referencing_object_type = oi_ref.type_desc,
-        referenced_schema_name = ISNULL(sed.referenced_schema_name, SCHEMA_NAME(oi_target.schema_id)),
-        referenced_object_name = sed.referenced_entity_name,
-        referenced_object_type = oi_target.type_desc,
-        referencing_object_definition = CASE
-                                            WHEN oi_ref.type IN ('P', 'IF', 'FN', 'TF') -- Only get definition for procs/funcs
-                                            THEN OBJECT_DEFINITION(oi_ref.object_id)
-                                            ELSE NULL
-                                        END
-    FROM
-        sys.sql_expression_dependencies sed
-    JOIN
-        ObjectInfo oi_ref ON sed.referencing_id = oi_ref.object_id
-    LEFT JOIN
-         ObjectInfo oi_target ON sed.referenced_id = oi_target.object_id
-    WHERE
-        sed.referenced_id IS NOT NULL
-        AND sed.referenced_database_name IS NULL
-        AND sed.referenced_server_name IS NULL
-        AND oi_target.object_id IS NOT NULL
-    ORDER BY
-        referencing_schema_name,
-        referencing_object_name;
-    """
     log.info("Fetching object dependencies and definitions for parsing...")
     try:
-        cursor.execute(query)
-        results = cursor.fetchall()
-        log.info(f"Found {len(results)} raw dependency relationships.")
-
-        processed_procs = set() # Track procs we've already parsed
-
-        for row in results:
-            ref_schema, ref_obj, ref_type, target_schema, target_obj, target_type, ref_def = row
-
-            # Store the direct dependency found via sys.sql_expression_dependencies
-            direct_dependencies.append({
-                'referencing_schema': ref_schema, 'referencing_object': ref_obj, 'referencing_type': ref_type,
-                'referenced_schema': target_schema, 'referenced_object': target_obj, 'referenced_type': target_type
-            })
-
-            # If the referencing object is a procedure/function and has a definition, parse it
-            ref_full_name = f"{ref_schema}.{ref_obj}"
-            if ref_def and ref_type in ('SQL_STORED_PROCEDURE', 'SQL_TABLE_VALUED_FUNCTION', 'SQL_SCALAR_FUNCTION', 'SQL_INLINE_TABLE_VALUED_FUNCTION'):
-                if ref_full_name not in processed_procs:
-                    log.debug(f"Parsing definition for {ref_full_name}...")
-                    io_details = _parse_sql_for_io(ref_def)
-                    if io_details['sources'] or io_details['targets']:
-                         parsed_flow_details[ref_full_name] = io_details
-                         log.debug(f"Parsed IO for {ref_full_name}: Sources={io_details['sources']}, Targets={io_details['targets']}")
-                    processed_procs.add(ref_full_name)
-
+        # Process rows batch by batch as they arrive: only a few batches of rows (and the definitions
+        # they carry) are held at a time. A background reader fetches the next batches while the
+        # definitions of the current one are parsed; only that thread touches the cursor.
+        with contextlib.closing(_prefetch(_dependency_batches(cursor))) as batches:
+            for kind, rows in batches:
+                if kind == 'edges':
+                    direct_dependencies.extend((f"{ref_schema}.{ref_obj}", f"{target_schema}.{target_obj}")
+                                               for ref_schema, ref_obj, target_schema, target_obj in rows)
+                    continue
+                for schema_name, object_name, object_type, definition in rows:
+                    # The driver returns a fresh string per row for the handful of type names; interning
+                    # shares one copy and lets the TYPE_STYLES lookups match by identity
+                    objects.append((schema_name, object_name, intern(object_type)))
+                    # Referencing procedures/functions come with their definition: parse it
+                    if definition:
+                        full_name = f"{schema_name}.{object_name}"
+                        log.debug(f"Parsing definition for {full_name}...")
+                        io_details = _parse_sql_for_io(definition)
+                        if io_details['sources'] or io_details['targets']:
+                             parsed_flow_details[full_name] = io_details
+                             log.debug(f"Parsed IO for {full_name}: Sources={io_details['sources']}, Targets={io_details['targets']}")
+
+        log.info(f"Found {len(direct_dependencies)} dependency relationships between {len(objects)} objects.")
         log.info(f"Processed dependencies. Found potential parsed flow for {len(parsed_flow_details)} procedures/functions.")
-        return {'direct_deps': direct_dependencies, 'parsed_flow': parsed_flow_details}
+        return {'objects': objects, 'direct_deps': direct_dependencies, 'parsed_flow': parsed_flow_details}
 
     except pyodbc.Error as ex:
         log.error(f"Error fetching dependencies/definitions: {ex}")
         raise RuntimeError(f"Failed to fetch dependencies/definitions: {ex}") from ex
     finally:
-        if cursor:
+        if owns_cursor:
             cursor.close()
 
 
 # --- Graph Generation ---
-def create_lineage_graph(dependency_data, db_name):
+# Graph-wide layout hints and default node/edge attributes
+GRAPH_ATTR = {'rankdir': 'LR', 'splines': 'true', 'overlap': 'false', 'nodesep': '0.5', 'ranksep': '1.0'}
+NODE_ATTR = {'shape': 'box', 'style': 'filled', 'fontname': 'Helvetica'}
+EDGE_ATTR = {'color': 'gray50', 'arrowhead': 'open'}
+
+# Define shapes/colors for different object types
+TYPE_STYLES = {
+    'USER_TABLE': {'shape': 'box', 'fillcolor': 'lightblue', 'group': 'table'},
+    'VIEW': {'shape': 'ellipse', 'fillcolor': 'lightgoldenrodyellow', 'group': 'view'},
+    'SQL_STORED_PROCEDURE': {'shape': 'cds', 'fillcolor': 'lightcoral', 'group': 'proc'},
+    'SQL_TABLE_VALUED_FUNCTION': {'shape': 'invhouse', 'fillcolor': 'lightgreen', 'group': 'func'},
+    'SQL_SCALAR_FUNCTION': {'shape': 'invhouse', 'fillcolor': 'lightgreen', 'group': 'func'},
+    'SQL_INLINE_TABLE_VALUED_FUNCTION': {'shape': 'invhouse', 'fillcolor': 'lightgreen', 'group': 'func'},
+    # Add more as needed
+}
+DEFAULT_STYLE = {'shape': 'component', 'fillcolor': 'lightgrey', 'group': 'other'}
+
+# Edge styles per kind of edge
+EDGE_STYLES = {
+    'dependency': {'style': 'dashed', 'color': 'grey'}, # Dashed for basic dependency
+    'read': {'style': 'solid', 'color': 'darkgreen', 'arrowhead': 'normal'}, # Solid green for read flow
+    'write': {'style': 'solid', 'color': 'darkred', 'arrowhead': 'normal'}, # Solid red for write flow
+}
+
+def _dot_attrs(attrs):
+    """Formats an attribute dict as DOT 'key=value' pairs (same layout graphviz.Digraph emits)."""
+    return ' '.join(f'{key}={value}' for key, value in sorted(attrs.items()))
+
+# Per-schema 'cluster_' subgraphs: dot lays each cluster out as a unit, and they frame the schemas
+CLUSTER_ATTR = {'style': 'filled', 'fillcolor': 'aliceblue', 'color': 'lightsteelblue'}
+
+# Schema nodes and cross-schema edges of the tiled index graph
+SCHEMA_STYLE = {'shape': 'folder', 'fillcolor': 'lightsteelblue'}
+SCHEMA_EDGE_STYLE = {'color': 'gray30', 'arrowhead': 'normal'}
+
+# DOT attribute text per node/edge style, formatted once for the DOT writers
+_STYLE_STR = {obj_type: _dot_attrs(style) for obj_type, style in TYPE_STYLES.items()}
+_DEFAULT_STYLE_STR = _dot_attrs(DEFAULT_STYLE)
+_EDGE_STR = {kind: _dot_attrs(style) for kind, style in EDGE_STYLES.items()}
+_SCHEMA_STYLE_STR = _dot_attrs(SCHEMA_STYLE)
+_SCHEMA_EDGE_STR = _dot_attrs(SCHEMA_EDGE_STYLE)
+
+def _dot_quote(text):
+    """Quotes a DOT ID/label, escaping embedded double quotes."""
+    return '"' + text.replace('"', '\\"') + '"'
+
+def _collect_lineage(dependency_data):
     """
-    Creates a graphviz.Digraph object using both direct dependencies
-    and parsed source/target information for procedures/functions.
+    Collects the lineage graph from both direct dependencies and parsed source/target
+    information for procedures/functions.
+    Returns (nodes, edges): nodes maps full_name -> (label, obj_type), edges is a list of
+    (tail, head, kind) with kind a key of EDGE_STYLES.
     """
+    objects = dependency_data.get('objects', [])
     direct_deps = dependency_data.get('direct_deps', [])
     parsed_flow = dependency_data.get('parsed_flow', {})
 
-    # Sanitize db_name for graph name
-    sanitized_db_name = "".join(c if c.isalnum() or c in ('_') else '_' for c in db_name)
-    dot = Digraph(
-        name=f'{sanitized_db_name}_lineage',
-        comment=f'Data Lineage for {db_name}',
-        graph_attr={'rankdir': 'LR', 'splines': 'true', 'overlap': 'false', 'nodesep': '0.5', 'ranksep': '1.0'}, # Layout hints
-        node_attr={'shape': 'box', 'style': 'filled', 'fontname': 'Helvetica'},
-        edge_attr={'color': 'gray50', 'arrowhead': 'open'}
-    )
+    # --- Nodes: every object in a dependency arrives exactly once from the objects query ---
+    log.info(f"Processing {len(objects)} objects and {len(direct_deps)} direct dependencies...")
+    nodes = {f"{schema}.{name}": (f"{schema}.\\n{name}", obj_type) for schema, name, obj_type in objects}
 
-    nodes = {} # Store node info: {full_name: {'label': '...', 'style': {...}}}
-
-    # Define shapes/colors for different object types
-    type_styles = {
-        'USER_TABLE': {'shape': 'box', 'fillcolor': 'lightblue', 'group': 'table'},
-        'VIEW': {'shape': 'ellipse', 'fillcolor': 'lightgoldenrodyellow', 'group': 'view'},
-        'SQL_STORED_PROCEDURE': {'shape': 'cds', 'fillcolor': 'lightcoral', 'group': 'proc'},
-        'SQL_TABLE_VALUED_FUNCTION': {'shape': 'invhouse', 'fillcolor': 'lightgreen', 'group': 'func'},
-        'SQL_SCALAR_FUNCTION': {'shape': 'invhouse', 'fillcolor': 'lightgreen', 'group': 'func'},
-        'SQL_INLINE_TABLE_VALUED_FUNCTION': {'shape': 'invhouse', 'fillcolor': 'lightgreen', 'group': 'func'},
-        # Add more as needed
-    }
-    default_style = {'shape': 'component', 'fillcolor': 'lightgrey', 'group': 'other'}
-
-    def add_node(full_name, obj_type, schema_name, obj_name):
-        """Helper to add node info to the nodes dictionary if not present."""
-        if full_name not in nodes:
-            style = type_styles.get(obj_type, default_style).copy() # Use copy
-            label = f"{schema_name}.\\n{obj_name}" if schema_name else obj_name
-            nodes[full_name] = {'label': label, 'style': style}
-
-    # --- Process Direct Dependencies (from sys.sql_expression_dependencies) ---
-    # These show fundamental references (e.g., View uses Table, Proc uses View/Table/Func)
-    log.info(f"Processing {len(direct_deps)} direct dependencies for graph nodes and basic edges...")
-    for dep in direct_deps:
-        ref_schema = dep['referencing_schema']
-        ref_obj = dep['referencing_object']
-        ref_type = dep['referencing_type']
-        target_schema = dep['referenced_schema']
-        target_obj = dep['referenced_object']
-        target_type = dep['referenced_type']
-
-        # Ensure schema is not None for node naming consistency
-        ref_schema = ref_schema or 'dbo' # Default schema if None
-        target_schema = target_schema or 'dbo'
-
-        ref_full_name = f"{ref_schema}.{ref_obj}"
-        target_full_name = f"{target_schema}.{target_obj}"
-
-        # Add nodes involved in this dependency
-        add_node(ref_full_name, ref_type, ref_schema, ref_obj)
-        add_node(target_full_name, target_type, target_schema, target_obj)
-
-        # Add edge representing the direct dependency: referenced -> referencing
-        # We draw it this way because sys.dependencies tells us 'ref' USES 'target'
-        dot.edge(target_full_name, ref_full_name, style='dashed', color='grey') # Dashed for basic dependency
+    # --- Direct Dependencies (from sys.sql_expression_dependencies) ---
+    # These show fundamental references (e.g., View uses Table, Proc uses View/Table/Func).
+    # Edge runs referenced -> referencing, because sys.dependencies tells us 'ref' USES 'target'.
+    edges = [(target_full_name, ref_full_name, 'dependency') for ref_full_name, target_full_name in direct_deps]
+    add_edge = edges.append
+
+    def add_parsed_node(full_name, obj_type):
+        """Adds a node known only from parsed SQL, splitting schema.object for the label."""
+        schema, obj = full_name.split('.', 1) if '.' in full_name else ('dbo', full_name)
+        nodes[full_name] = (f"{schema}.\\n{obj}", obj_type)
 
     # --- Process Parsed Flow (for Procedures/Functions) ---
     log.info(f"Processing {len(parsed_flow)} parsed procedures/functions for flow edges...")
@@ -304,64 +420,388 @@ def create_lineage_graph(dependency_data, db_name):
              # This might happen if a proc has no dependencies listed in sys.dependencies
              # but was parsed (e.g., only inserts literal values). Try to add it.
              # We need its type, guess 'SQL_STORED_PROCEDURE' if unknown.
-             schema, obj = proc_full_name.split('.', 1) if '.' in proc_full_name else ('dbo', proc_full_name)
-             add_node(proc_full_name, 'SQL_STORED_PROCEDURE', schema, obj)
+             add_parsed_node(proc_full_name, 'SQL_STORED_PROCEDURE')
              log.warning(f"Procedure {proc_full_name} was parsed but not found in direct dependencies nodes. Added with default type.")
 
 
         # Add edges for parsed sources: source -> procedure
         for source_name in io_details.get('sources', set()):
             # Attempt to resolve schema if missing (assume dbo)
-            if '.' not in source_name:
-                source_full_name = f"dbo.{source_name}"
-            else:
-                source_full_name = source_name
+            source_full_name = source_name if '.' in source_name else f"dbo.{source_name}"
 
             # Add source node if it doesn't exist (might be a table/view not caught by direct deps)
             if source_full_name not in nodes:
-                 schema, obj = source_full_name.split('.', 1) if '.' in source_full_name else ('dbo', source_full_name)
                  # Guess type as USER_TABLE if unknown
-                 add_node(source_full_name, 'USER_TABLE', schema, obj)
+                 add_parsed_node(source_full_name, 'USER_TABLE')
                  log.warning(f"Source '{source_full_name}' from parsed flow for {proc_full_name} not found in nodes. Added with default type 'USER_TABLE'.")
 
             # Draw edge: source -> proc
-            dot.edge(source_full_name, proc_full_name, style='solid', color='darkgreen', arrowhead='normal') # Solid green for read flow
+            add_edge((source_full_name, proc_full_name, 'read'))
 
         # Add edges for parsed targets: procedure -> target
         for target_name in io_details.get('targets', set()):
-            if '.' not in target_name:
-                target_full_name = f"dbo.{target_name}"
-            else:
-                target_full_name = target_name
+            target_full_name = target_name if '.' in target_name else f"dbo.{target_name}"
 
             if target_full_name not in nodes:
-                 schema, obj = target_full_name.split('.', 1) if '.' in target_full_name else ('dbo', target_full_name)
-                 add_node(target_full_name, 'USER_TABLE', schema, obj)
+                 add_parsed_node(target_full_name, 'USER_TABLE')
                  log.warning(f"Target '{target_full_name}' from parsed flow for {proc_full_name} not found in nodes. Added with default type 'USER_TABLE'.")
 
             # Draw edge: proc -> target
-            dot.edge(proc_full_name, target_full_name, style='solid', color='darkred', arrowhead='normal') # Solid red for write flow
+            add_edge((proc_full_name, target_full_name, 'write'))
+
+    return nodes, edges
+
+def _node_schema(full_name):
+    """Schema part of a collected node name ('schema.object')."""
+    return full_name.split('.', 1)[0]
 
+def _group_by_schema(names):
+    """Groups node names (or tuples starting with one) by schema, keeping their order."""
+    groups = {}
+    for item in names:
+        groups.setdefault(_node_schema(item if isinstance(item, str) else item[0]), []).append(item)
+    return groups
+
+# Any character that is not alphanumeric or '_' (\W matches exactly the complement of str.isalnum() + '_')
+_NON_NAME_CHARS = re.compile(r'\W')
+
+@functools.lru_cache(maxsize=128)
+def _sanitize_name(name):
+    """Replaces every non-alphanumeric, non-underscore character with '_' (graph and file names)."""
+    return _NON_NAME_CHARS.sub('_', name)
+
+def _graph_name(db_name):
+    """Sanitized graph name for a database."""
+    return f'{_sanitize_name(db_name)}_lineage'
+
+def create_lineage_graph(dependency_data, db_name, engine='dot'):
+    """
+    Creates a graphviz.Digraph object using both direct dependencies
+    and parsed source/target information for procedures/functions, set to lay out with engine.
+    For writing a DOT file, write_lineage_dot is faster; this is kept for callers that need the object.
+    """
+    nodes, edges = _collect_lineage(dependency_data)
+    dot = Digraph(
+        name=_graph_name(db_name),
+        comment=f'Data Lineage for {db_name}',
+        graph_attr=GRAPH_ATTR, # Layout hints
+        node_attr=NODE_ATTR,
+        edge_attr=EDGE_ATTR,
+        engine=engine
+    )
 
-    # --- Add all collected nodes to the graph ---
-    log.info(f"Adding {len(nodes)} unique nodes to the graph...")
-    for name, node_info in nodes.items():
-        dot.node(name, label=node_info['label'], **node_info['style'])
+    # Emit each collected node once, inside its schema's cluster when there are several schemas,
+    # then the edges at the top level
+    log.info(f"Adding {len(nodes)} unique nodes and {len(edges)} edges to the graph...")
+    get_style = TYPE_STYLES.get
+    clusters = _group_by_schema(nodes)
+    if len(clusters) > 1:
+        for schema, names in clusters.items():
+            with dot.subgraph(name=f'cluster_{schema}') as cluster:
+                cluster.attr(label=schema, **CLUSTER_ATTR)
+                for name in names:
+                    label, obj_type = nodes[name]
+                    cluster.node(name, label=label, **get_style(obj_type, DEFAULT_STYLE))
+    else:
+        node = dot.node
+        for name, (label, obj_type) in nodes.items():
+            node(name, label=label, **get_style(obj_type, DEFAULT_STYLE))
+    edge = dot.edge
+    for tail, head, kind in edges:
+        edge(tail, head, **EDGE_STYLES[kind])
 
     log.info("Graph creation complete.")
     return dot
 
+def _styled_nodes(nodes, names):
+    """Yields (name, label, attribute text) for the given names of collected nodes."""
+    get_style_str = _STYLE_STR.get
+    for name in names:
+        label, obj_type = nodes[name]
+        yield name, label, get_style_str(obj_type, _DEFAULT_STYLE_STR)
+
+def _styled_edges(edges):
+    """Yields (tail, head, attribute text) for collected edges."""
+    return ((tail, head, _EDGE_STR[kind]) for tail, head, kind in edges)
+
+def _write_dot(path, title, graph_name, node_lines, edge_lines, clustered=False):
+    """
+    Writes a digraph with the shared layout defaults to a DOT file. node_lines yields
+    (name, label, attribute text) and edge_lines yields (tail, head, attribute text).
+    With clustered, nodes spanning several schemas are written into one 'cluster_<schema>'
+    subgraph per schema; edges always stay at the top level.
+    """
+    quote = _dot_quote
+    with open(path, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        write = f.write
+        write(f"// Data Lineage for {title}\n")
+        write(f"digraph {quote(graph_name)} {{\n")
+        write(f"\tgraph [{_dot_attrs(GRAPH_ATTR)}]\n")
+        write(f"\tnode [{_dot_attrs(NODE_ATTR)}]\n")
+        write(f"\tedge [{_dot_attrs(EDGE_ATTR)}]\n")
+        if clustered:
+            clusters = _group_by_schema(node_lines)
+            if len(clusters) > 1:
+                for schema, lines in clusters.items():
+                    write(f"\tsubgraph {quote(f'cluster_{schema}')} {{\n")
+                    write(f"\t\tgraph [{_dot_attrs({**CLUSTER_ATTR, 'label': quote(schema)})}]\n")
+                    for name, label, attrs in lines:
+                        write(f"\t\t{quote(name)} [label={quote(label)} {attrs}]\n")
+                    write("\t}\n")
+                node_lines = ()
+            else:
+                node_lines = [line for lines in clusters.values() for line in lines]
+        for name, label, attrs in node_lines:
+            write(f"\t{quote(name)} [label={quote(label)} {attrs}]\n")
+        for tail, head, attrs in edge_lines:
+            write(f"\t{quote(tail)} -> {quote(head)} [{attrs}]\n")
+        write("}\n")
+
+def write_lineage_dot(dependency_data, db_name, path):
+    """
+    Writes the lineage graph straight to a DOT file at path, without building a graphviz.Digraph
+    (no per-node/edge wrapper calls or retained list of source lines). Produces the same graph
+    as create_lineage_graph(...).save(path).
+    """
+    nodes, edges = _collect_lineage(dependency_data)
+    log.info(f"Writing {len(nodes)} unique nodes and {len(edges)} edges to {path}...")
+    _write_dot(path, db_name, _graph_name(db_name), _styled_nodes(nodes, nodes), _styled_edges(edges),
+               clustered=True)
+    log.info("Graph creation complete.")
+
+def write_lineage_tiles(dependency_data, db_name, output_dir, node_threshold=None):
+    """
+    Writes the lineage DOT file(s) for a database into the existing output_dir and returns their
+    paths as strings, with the lineage_dot_path(output_dir, db_name) file first.
+    Up to node_threshold (by default TILE_NODE_THRESHOLD) nodes this is the whole graph, as written
+    by write_lineage_dot. Larger graphs are tiled: one '<db>_<schema>_lineage.gv' per schema, holding
+    the schema's objects and the edges of its referencing objects (with the objects they reach in
+    other schemas), while '<db>_lineage.gv' becomes a small index with one node per schema and the
+    cross-schema edge counts.
+    """
+    if node_threshold is None:
+        node_threshold = TILE_NODE_THRESHOLD
+    nodes, edges = _collect_lineage(dependency_data)
+    # Every file shares this directory, so each path is a single string format
+    out_prefix = f"{os.fspath(output_dir)}{os.sep}"
+    index_path = f"{out_prefix}{_graph_name(db_name)}.gv"
+    if len(nodes) <= node_threshold:
+        log.info(f"Writing {len(nodes)} unique nodes and {len(edges)} edges to {index_path}...")
+        _write_dot(index_path, db_name, _graph_name(db_name), _styled_nodes(nodes, nodes), _styled_edges(edges),
+                   clustered=True)
+        log.info("Graph creation complete.")
+        return [index_path]
+
+    # Partition: each node belongs to its own schema's tile; each edge belongs to the tile of its
+    # referencing object (the procedure for read/write flow, the referencing side for dependencies)
+    schema_of = {name: _node_schema(name) for name in nodes}
+    tile_nodes = {}
+    for name, schema in schema_of.items():
+        tile_nodes.setdefault(schema, {})[name] = None # dict as an insertion-ordered set
+    schema_sizes = {schema: len(members) for schema, members in tile_nodes.items()}
+    tile_edges = {}
+    cross_schema = Counter()
+    for edge in edges:
+        tail, head, kind = edge
+        schema = schema_of[tail if kind == 'write' else head]
+        tile_edges.setdefault(schema, []).append(edge)
+        members = tile_nodes[schema]
+        members[tail] = None
+        members[head] = None
+        if schema_of[tail] != schema_of[head]:
+            cross_schema[schema_of[tail], schema_of[head]] += 1
+
+    log.info(f"Tiling {len(nodes)} nodes and {len(edges)} edges into {len(tile_nodes)} schema graphs...")
+    dot_paths = [index_path]
+    # Sanitizing can map different schemas (e.g. 'a.b' and 'a_b', or 'Sales' and 'sales' on a
+    # case-insensitive filesystem) to one name; later ones get a numeric suffix. Schemas are taken
+    # in sorted order so each keeps the same file name from run to run.
+    used_names = {_graph_name(db_name).casefold()}
+    for schema in sorted(tile_nodes):
+        graph_name = base_name = _graph_name(f"{db_name}_{schema}")
+        suffix = 1
+        while graph_name.casefold() in used_names:
+            suffix += 1
+            graph_name = f"{base_name}_{suffix}"
+        used_names.add(graph_name.casefold())
+        path = f"{out_prefix}{graph_name}.gv"
+        _write_dot(path, f"{db_name} (schema {schema})", graph_name,
+                   _styled_nodes(nodes, tile_nodes[schema]), _styled_edges(tile_edges.get(schema, ())), clustered=True)
+        dot_paths.append(path)
+
+    # Index graph: schemas as nodes, labelled with their object count, edges labelled with how many
+    # object-level edges cross between the two schemas
+    _write_dot(index_path, db_name, _graph_name(db_name),
+               ((schema, f"{schema}\\n{size} object{'' if size == 1 else 's'}", _SCHEMA_STYLE_STR)
+                for schema, size in schema_sizes.items()),
+               ((tail, head, f"{_SCHEMA_EDGE_STR} label={count}") for (tail, head), count in cross_schema.items()))
+    log.info("Graph creation complete.")
+    return dot_paths
+
+# --- Rendering ---
+def lineage_dot_path(output_dir, database):
+    """Returns the path of the lineage DOT file generate_lineage writes for a database."""
+    # Same sanitized name as the graph inside the file
+    return Path(output_dir) / f"{_graph_name(database)}.gv"
+
+def render_all(dot_paths, fmt='svg', batch_size=RENDER_BATCH_SIZE, engine='dot'):
+    """
+    Renders DOT files with one 'dot -O' process per batch of up to batch_size files, so the
+    Graphviz startup cost is paid once per batch instead of once per graph. Each file is rendered
+    next to its source as '<file>.<fmt>' (e.g. X_lineage.gv.svg). Returns the rendered paths.
+    SVG is the default: 'dot' serializes it directly, with no rasterization, so it is much faster
+    than PNG for large graphs and usually smaller on disk. Pass fmt='png' for a raster image.
+    engine selects the Graphviz layout engine ('-K'), e.g. 'sfdp' for very large graphs.
+    Raises FileNotFoundError if 'dot' is not installed and subprocess.CalledProcessError if it fails.
+    Callers generating lineage for many databases can pass skip_render=True to generate_lineage,
+    collect lineage_dot_path() for each, and render them all here in one go.
+    """
+    dot_paths = [str(p) for p in dot_paths]
+    command = ['dot', f'-T{fmt}', '-O'] if engine == 'dot' else ['dot', f'-K{engine}', f'-T{fmt}', '-O']
+    for start in range(0, len(dot_paths), batch_size):
+        batch = dot_paths[start:start + batch_size]
+        subprocess.run([*command, *batch], check=True, capture_output=True, text=True)
+    return [f"{p}.{fmt}" for p in dot_paths]
+
+def _render_error_message(e):
+    """Describes a render_all failure for the render error reported by generate_lineage."""
+    if isinstance(e, FileNotFoundError):
+        return f"Graphviz executable not found. Cannot render graph. Please install Graphviz. Error: {e}"
+    if isinstance(e, subprocess.CalledProcessError):
+        return f"An error occurred during graph rendering: {(e.stderr or '').strip() or e}"
+    return f"An error occurred during graph rendering: {e}"
+
+def render_all_parallel(dot_paths, workers=None, fmt='svg', engine='dot'):
+    """
+    Splits dot_paths into one share per worker and renders each share with render_all on its own
+    thread. The layout work happens in the 'dot' processes, so threads are enough to keep every
+    core busy. Returns (rendered_paths, errors), with one error message per failed share.
+    """
+    dot_paths = list(dot_paths)
+    if not dot_paths:
+        return [], []
+    workers = min(workers or os.cpu_count() or 1, len(dot_paths))
+    share_size = -(-len(dot_paths) // workers) # Ceiling division
+    shares = [dot_paths[i:i + share_size] for i in range(0, len(dot_paths), share_size)]
+
+    rendered, errors = [], []
+    with ThreadPoolExecutor(max_workers=len(shares)) as executor:
+        futures = [executor.submit(render_all, share, fmt, engine=engine) for share in shares]
+        for future in as_completed(futures):
+            try:
+                rendered.extend(future.result())
+            except Exception as e:
+                errors.append(_render_error_message(e))
+    return rendered, errors
+
+
+# --- Output Cache ---
+def _dependency_hash(dependency_data):
+    """
+    Digest of the dependency set (objects, direct dependencies and parsed source/target flow). Lines are
+    sorted before hashing, so the digest does not depend on the order rows arrived in.
+    """
+    lines = [f"{schema}.{name}|{obj_type}\n" for schema, name, obj_type in dependency_data.get('objects', [])]
+    lines.extend(f"{ref_full_name}>{target_full_name}\n" for ref_full_name, target_full_name in dependency_data.get('direct_deps', []))
+    for proc_full_name, io_details in dependency_data.get('parsed_flow', {}).items():
+        sources = '|'.join(sorted(io_details.get('sources', ())))
+        targets = '|'.join(sorted(io_details.get('targets', ())))
+        lines.append(f"{proc_full_name}<{sources}>{targets}\n")
+    lines.sort()
+
+    digest = hashlib.blake2b(digest_size=16)
+    for line in lines:
+        digest.update(line.encode('utf-8'))
+    return digest.hexdigest()
+
+def _write_hash_file(hash_path, dependency_hash, dot_paths):
+    """
+    Records a run: the dependency hash on the first line (empty for an incomplete run, which never
+    matches), then the names of the DOT files it wrote.
+    The cache only saves work, so an OSError is logged as a warning rather than failing the run.
+    """
+    try:
+        with open(hash_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join([dependency_hash, *(os.path.basename(p) for p in dot_paths)]) + "\n")
+    except OSError as e:
+        log.warning(f"Could not update lineage cache file {hash_path}: {e}")
+        # An old hash that can't be overwritten must not match output this run has changed
+        with contextlib.suppress(OSError):
+            os.remove(hash_path)
+
+def _read_hash_file(hash_path):
+    """Returns (dependency_hash, dot_names) recorded by _write_hash_file, or (None, []) if there is none."""
+    try:
+        with open(hash_path, encoding='utf-8') as f:
+            recorded_hash, *dot_names = f.read().splitlines()
+    except (OSError, ValueError):
+        return None, [] # No previous run (unreadable or empty)
+    return recorded_hash, dot_names
+
+def _is_cached(hash_path, dependency_hash, image_format=None):
+    """
+    True if hash_path records dependency_hash and every DOT file from that run (and, with an
+    image_format, its rendered '<file>.<image_format>') still exists next to it.
+    """
+    recorded_hash, dot_names = _read_hash_file(hash_path)
+    if recorded_hash != dependency_hash or not dot_names:
+        return False
+    out_prefix = f"{os.path.dirname(hash_path)}{os.sep}"
+    outputs = dot_names if image_format is None else dot_names + [f"{name}.{image_format}" for name in dot_names]
+    return all(os.path.exists(f"{out_prefix}{name}") for name in outputs)
+
+def _remove_stale_outputs(output_dir, old_dot_names, dot_paths, image_format=None):
+    """
+    Deletes DOT files a previous run wrote that this run did not (e.g. per-schema tiles of a schema
+    that is gone, or of a graph no longer large enough to tile), along with their renderings in
+    RENDERED_IMAGE_FORMATS or image_format. A file that can't be removed is logged as a warning and
+    left in place.
+    """
+    stale = set(old_dot_names).difference(os.path.basename(p) for p in dot_paths)
+    if not stale:
+        return
+    # '<name>.gv' itself, or a rendering of it such as '<name>.gv.svg'; not e.g. a '<name>.gv.bak' copy
+    formats = {*RENDERED_IMAGE_FORMATS, image_format} if image_format else RENDERED_IMAGE_FORMATS
+    doomed = stale.union(f"{name}.{fmt}" for name in stale for fmt in formats)
+    try:
+        with os.scandir(output_dir) as it:
+            entries = [entry.path for entry in it if entry.name in doomed]
+    except OSError as e:
+        log.warning(f"Could not list {output_dir} to remove stale lineage output: {e}")
+        return
+    for path in entries:
+        try:
+            os.remove(path)
+            log.debug(f"Removed stale lineage output {path}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning(f"Could not remove stale lineage output {path}: {e}")
+
+
 # --- Main Orchestration Function ---
-def generate_lineage(server, database, username, password, output_dir, skip_render=False):
-    """Fetches dependencies, creates DOT graph, and optionally renders it."""
-    conn = None
+def generate_lineage(server, database, username, password, output_dir, skip_render=False, conn=None,
+                     output_format='svg', engine=None):
+    """
+    Fetches dependencies, creates DOT graph, and optionally renders it.
+    Pass an open conn (e.g. from core.ConnectionPool) to reuse it; it is left open for the caller.
+    output_format is the Graphviz output format of the rendered image; 'svg' (the default) renders
+    fastest, 'png' is still available for a raster image.
+    engine is the Graphviz layout engine; by default 'dot', or 'sfdp' above SFDP_DEPENDENCY_THRESHOLD
+    direct dependencies, where 'dot' layout takes minutes.
+    """
+    owns_conn = conn is None
     dependencies_fetched = False
     dot_file_created = False
     render_error_message = None
+    cursor = None
 
     try:
-        conn = get_db_connection(server, database, username, password) # Use shared connection logic
-        dependency_data = fetch_dependencies(conn) # Now returns a dict
+        if owns_conn:
+            conn = get_db_connection(server, database, username, password) # Use shared connection logic
+        # One statement handle for every lineage query on this connection
+        cursor = conn.cursor()
+        dependency_data = fetch_dependencies(conn, cursor=cursor) # Now returns a dict
         dependencies_fetched = True # Assume fetch succeeded if no exception
 
         if not dependency_data or (not dependency_data.get('direct_deps') and not dependency_data.get('parsed_flow')):
@@ -369,20 +809,31 @@ def generate_lineage(server, database, username, password, output_dir, skip_rend
             # Still consider dependency fetch successful, but graph might be empty
             return dependencies_fetched, dot_file_created, render_error_message # Return status
 
-        # Create graph object using the combined data
-        dot_graph = create_lineage_graph(dependency_data, database)
-
-        # Define output paths
-        output_path = Path(output_dir)
-        output_path.mkdir(parents=True, exist_ok=True) # Ensure output dir exists
-        # Sanitize db name for filename
-        sanitized_db_name = "".join(c if c.isalnum() or c in ('_') else '_' for c in database)
-        base_filename = output_path / f"{sanitized_db_name}_lineage"
-        dot_filename = base_filename.with_suffix(".gv")
-
-        # Save DOT file
+        # Define output paths: one makedirs for the directory, then plain string paths inside it
+        output_dir = os.fspath(output_dir)
+        os.makedirs(output_dir, exist_ok=True) # Ensure output dir exists
+        graph_path = f"{output_dir}{os.sep}{_graph_name(database)}"
+        dot_filename = f"{graph_path}.gv" # Same as lineage_dot_path(output_dir, database)
+        # Dependency-set hash of the last complete run (DOT written and, if requested, rendered)
+        hash_filename = f"{graph_path}.hash"
+
+        if engine is None:
+            engine = 'sfdp' if len(dependency_data.get('direct_deps', ())) > SFDP_DEPENDENCY_THRESHOLD else 'dot'
+
+        # Unchanged dependencies produce byte-identical output, so skip writing and rendering entirely.
+        # The engine is part of the key: another layout of the same dependencies is a different image.
+        dependency_hash = f"{_dependency_hash(dependency_data)}-{engine}"
+        if _is_cached(hash_filename, dependency_hash, None if skip_render else output_format):
+            log.info(f"Lineage dependencies unchanged since the last run; using cached output in {output_dir}")
+            return dependencies_fetched, True, None
+        # Invalidate before rewriting, so a failed run can't leave a hash that matches stale output,
+        # but keep the list of files the previous run wrote so they can be cleaned up below
+        _, previous_dot_names = _read_hash_file(hash_filename)
+        _write_hash_file(hash_filename, "", previous_dot_names)
+
+        # Write the DOT file(s) directly from the combined data; large graphs are tiled per schema
         try:
-            dot_graph.save(filename=str(dot_filename))
+            dot_files = write_lineage_tiles(dependency_data, database, output_dir)
             log.info(f"Lineage DOT graph saved to {dot_filename}")
             dot_file_created = True
         except IOError as e:
@@ -390,22 +841,34 @@ def generate_lineage(server, database, username, password, output_dir, skip_rend
             # Continue to attempt rendering if requested, but report DOT save failure later?
             # For now, let's stop if DOT save fails.
             raise RuntimeError(f"Failed to save DOT file: {e}") from e
+        # Tiles left over from an earlier run would make the set of files on disk inconsistent
+        _remove_stale_outputs(output_dir, previous_dot_names, dot_files, output_format)
+        _write_hash_file(hash_filename, "", dot_files)
 
         # Render graph (optional)
-        if not skip_render:
-            try:
-                # Render to PNG (default format)
-                rendered_path = dot_graph.render(filename=str(dot_filename), view=False, cleanup=True) # cleanup removes dot file after render
-                # Re-save the dot file if cleanup=True removed it
-                if not dot_filename.exists():
-                     dot_graph.save(filename=str(dot_filename))
-                log.info(f"Lineage graph rendered to {rendered_path}")
-            except ExecutableNotFound as e:
-                render_error_message = f"Graphviz executable not found. Cannot render graph. Please install Graphviz. Error: {e}"
-                log.error(render_error_message)
-            except Exception as e: # Catch other rendering errors
-                render_error_message = f"An error occurred during graph rendering: {e}"
-                log.error(render_error_message, exc_info=True)
+        if not skip_render and not _GRAPHVIZ_AVAILABLE:
+            render_error_message = "Graphviz executable not found. Cannot render graph. Please install Graphviz."
+            log.error(render_error_message)
+        elif not skip_render:
+            # Render to output_format from the saved DOT files, which 'dot -O' leaves in place
+            if len(dot_files) > 1:
+                # Independent graphs: spread them over parallel 'dot' processes
+                rendered_paths, errors = render_all_parallel(dot_files, fmt=output_format, engine=engine)
+                if errors:
+                    render_error_message = "; ".join(errors)
+                    log.error(render_error_message)
+                log.info(f"Rendered {len(rendered_paths)} of {len(dot_files)} lineage graphs in {output_dir}")
+            else:
+                try:
+                    rendered_path, = render_all(dot_files, output_format, engine=engine)
+                    log.info(f"Lineage graph rendered to {rendered_path}")
+                except Exception as e: # Missing executable, 'dot' failure or other rendering errors
+                    render_error_message = _render_error_message(e)
+                    log.error(render_error_message)
+
+        if render_error_message is None:
+            # Record the completed run; delete the .hash file to force regeneration
+            _write_hash_file(hash_filename, dependency_hash, dot_files)
 
     except (ConnectionError, RuntimeError, pyodbc.Error) as e:
         # Catch connection errors or dependency fetch errors
@@ -419,7 +882,9 @@ def generate_lineage(server, database, username, password, output_dir, skip_rend
         # Store the error to check in steps?
         # Let's return the status tuple
     finally:
-        if conn:
+        if cursor:
+            cursor.close()
+        if owns_conn and conn:
             conn.close()
             log.debug("Lineage database connection closed.")
 